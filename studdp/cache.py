@@ -0,0 +1,154 @@
+"""
+Document store for the on demand mode. Instead of downloading every document the crawl only records where it would be
+stored. Documents are fetched when requested, and once the configured quota is exceeded the least recently accessed
+documents are deleted again. They stay in the store and can be fetched again at any time.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from os.path import expanduser, join
+
+log = logging.getLogger(__name__)
+
+STORE_PATH = expanduser(join('~', '.studdp', 'documents.db'))
+
+
+class Store:
+    """
+    sqlite backed record of all known documents, whether they are currently on disk and when they were last accessed.
+    quota is given in bytes, 0 means no limit.
+    """
+    def __init__(self, quota=0, path=STORE_PATH):
+        self.quota = quota
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, path TEXT, chtime INTEGER, "
+                             "size INTEGER, fetched INTEGER DEFAULT 0, accessed REAL DEFAULT 0, sha256 TEXT)")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(documents)")]
+            if "sha256" not in columns:
+                self._db.execute("ALTER TABLE documents ADD COLUMN sha256 TEXT")
+            if any(row[3] == "u" for row in self._db.execute("PRAGMA index_list(documents)")):
+                # stores of older versions required unique paths, but stud.ip allows documents of the same name in a folder
+                self._db.execute("ALTER TABLE documents RENAME TO old_documents")
+                self._db.execute("CREATE TABLE documents (id TEXT PRIMARY KEY, path TEXT, chtime INTEGER, size INTEGER, "
+                                 "fetched INTEGER DEFAULT 0, accessed REAL DEFAULT 0, sha256 TEXT)")
+                self._db.execute("INSERT INTO documents SELECT id, path, chtime, size, fetched, accessed, sha256 "
+                                 "FROM old_documents")
+                self._db.execute("DROP TABLE old_documents")
+            self._db.execute("CREATE INDEX IF NOT EXISTS documents_path ON documents (path)")
+
+    def update(self, documents, auto=False):
+        """
+        record documents found during the crawl, given as (document, local path) tuples. Only documents whose path, change
+        time or presence on disk differ from the record are written, all in a single transaction. Returns the ids of the
+        documents that should be downloaded now: those with an outdated local copy and, if auto is set, those that are new
+        or changed. Their change time is only recorded by fetched, so they are still wanted if the download does not happen.
+        """
+        rows = {}
+        ids = [document.id for document, _ in documents]
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                query = "SELECT id, path, chtime, fetched FROM documents WHERE id IN (%s)" % ",".join("?" * len(chunk))
+                rows.update((row[0], row[1:]) for row in self._db.execute(query, chunk))
+        wanted = set()
+        changes = []
+        paths = {}
+        for document, path in documents:
+            if path in paths:
+                log.warning("%s and %s are both stored at %s" % (paths[path], document.id, path))
+            paths[path] = document.id
+            row = rows.get(document.id)
+            chtime = int(document.chtime)
+            fetched = int(os.path.exists(path))
+            if row is None:
+                # a local copy of an unknown document, e.g. from before on demand mode was enabled, is kept if it is newer
+                changed = not fetched or os.path.getmtime(path) < chtime
+            else:
+                changed = row[1] < chtime
+            recorded = chtime
+            if changed and (auto or fetched):
+                wanted.add(document.id)
+                recorded = row[1] if row is not None else 0
+            if row != (path, recorded, fetched):
+                changes.append((document.id, path, recorded, document.size, fetched, document.id))
+        if changes:
+            with self._lock, self._db:
+                self._db.executemany("INSERT OR REPLACE INTO documents (id, path, chtime, size, fetched, accessed) VALUES "
+                                     "(?, ?, ?, ?, ?, COALESCE((SELECT accessed FROM documents WHERE id = ?), 0))", changes)
+        return wanted
+
+    def lookup(self, path):
+        """
+        list of (document_id, path, size) of all recorded documents at or below a local path
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            return self._db.execute("SELECT id, path, size FROM documents WHERE path = ? OR substr(path, 1, ?) = ?",
+                                    (path, len(path) + 1, path + os.sep)).fetchall()
+
+    def fetched(self, path, sha256=None, document=None):
+        """
+        mark the document at path as present on disk and evict others if the quota is exceeded. sha256 is the hash of a
+        fresh download and is kept until the next one. document is the document that was downloaded, its change time is
+        recorded so it is considered current from now on.
+        """
+        with self._lock, self._db:
+            self._db.execute("UPDATE documents SET fetched = 1, size = ?, accessed = ?, sha256 = COALESCE(?, sha256) "
+                             "WHERE path = ?", (os.path.getsize(path), time.time(), sha256, path))
+            if document is not None:
+                self._db.execute("UPDATE documents SET chtime = ? WHERE id = ?", (int(document.chtime), document.id))
+        self.evict(keep=path)
+
+    def sha256(self, path):
+        """
+        hash of the document at path as computed during its last download, None if unknown
+        """
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM documents WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def usage(self):
+        """
+        bytes used by all fetched documents
+        """
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM documents "
+                                    "WHERE fetched = 1 GROUP BY path)").fetchone()[0]
+
+    def evict(self, keep=None):
+        """
+        delete the least recently accessed documents until the quota is met. The access time is the later one of the fetch
+        time and the access time the file system reports.
+        """
+        if not self.quota:
+            return
+        with self._lock, self._db:
+            rows = self._db.execute("SELECT path, MAX(size), MAX(accessed) FROM documents WHERE fetched = 1 "
+                                    "GROUP BY path").fetchall()
+            used = sum(size for _, size, _ in rows)
+            if used <= self.quota:
+                return
+            candidates = []
+            for path, size, accessed in rows:
+                try:
+                    candidates.append((max(accessed, os.stat(path).st_atime), path, size))
+                except FileNotFoundError:
+                    self._db.execute("UPDATE documents SET fetched = 0 WHERE path = ?", (path,))
+                    used -= size
+            for _, path, size in sorted(candidates):
+                if used <= self.quota:
+                    break
+                if path == keep:
+                    continue
+                log.info("Evicting %s" % path)
+                os.remove(path)
+                self._db.execute("UPDATE documents SET fetched = 0 WHERE path = ?", (path,))
+                used -= size
+
+    def close(self):
+        self._db.close()
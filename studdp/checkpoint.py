@@ -0,0 +1,188 @@
+"""
+Persistent progress of sync cycles. The Checkpoint records every folder that was completely handled in the current cycle, so
+a cycle that was interrupted can be resumed instead of starting over. The RetryQueue keeps folders and documents that failed
+and hands them out again with exponential backoff.
+"""
+import os
+import json
+import time
+import logging
+from os.path import expanduser, join
+from .model import Folder, Document
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = expanduser(join('~', '.studdp', 'checkpoint'))
+RETRY_PATH = expanduser(join('~', '.studdp', 'retries.json'))
+
+RETRY_DELAY = 60
+MAX_ATTEMPTS = 8
+
+
+def key(node):
+    """
+    identifier of a folder or document that is stable across cycles
+    """
+    return "%s/%s" % (node.course.id, node.id)
+
+
+def _chain(folder):
+    """
+    list of (id, title) of all folders between the course and folder, which is enough to rebuild the folder without listing
+    its parents again.
+    """
+    chain = []
+    while folder.parent is not None:
+        chain.append((folder.id, folder._title))
+        folder = folder.parent
+    return list(reversed(chain))
+
+
+class Checkpoint:
+    """
+    Append only record of the folders finished in the current cycle. The first line holds the start of the cycle and the time
+    of the last check it compares documents against.
+    """
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._done = set()
+        self._file = None
+
+    def start(self, since, max_age):
+        """
+        start a cycle. If an unfinished cycle younger than max_age seconds is found it is resumed. Returns the time of the last
+        check the cycle should use.
+        """
+        self._done = set()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+            try:
+                header = json.loads(lines[0])
+            except (IndexError, ValueError):
+                header = None
+            if header and time.time() - header["started"] < max_age:
+                self._done = set(lines[1:])
+                since = header["since"]
+                log.info("Resuming cycle from %s, %d folders already done" % (time.ctime(header["started"]), len(self._done)))
+                self._file = open(self.path, "a")
+                return since
+        self._file = open(self.path, "w")
+        self._file.write(json.dumps({"started": time.time(), "since": since}) + "\n")
+        self._file.flush()
+        return since
+
+    def __contains__(self, node_key):
+        return node_key in self._done
+
+    def done(self, node_key):
+        """
+        record a folder as finished. Does nothing outside of a cycle.
+        """
+        if self._file is None:
+            return
+        self._done.add(node_key)
+        self._file.write(node_key + "\n")
+        self._file.flush()
+
+    def close(self):
+        """
+        stop recording, keeping the checkpoint so the cycle can be resumed
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """
+        the cycle completed, forget about it
+        """
+        self.close()
+        self._done = set()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RetryQueue:
+    """
+    Folders and documents that failed, persisted as json. Every failure doubles the delay before the next attempt, starting at
+    RETRY_DELAY seconds. Entries are dropped after MAX_ATTEMPTS failures; the next full cycle will pick them up again.
+    """
+    def __init__(self, path=RETRY_PATH):
+        self.path = path
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                log.warning("Ignoring corrupt retry queue %s" % path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self._entries, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def add(self, node, since):
+        """
+        queue a folder or document that failed. since is the time of the last check it was compared against.
+        """
+        self.add_all([node], since)
+
+    def add_all(self, nodes, since):
+        """
+        queue several folders or documents that failed in the same check, writing the queue only once
+        """
+        for node in nodes:
+            node_key = key(node)
+            attempts = self._entries.get(node_key, {}).get("attempts", 0) + 1
+            if attempts > MAX_ATTEMPTS:
+                log.error("Giving up on %s after %d attempts" % (node_key, MAX_ATTEMPTS))
+                self._entries.pop(node_key, None)
+                continue
+            if isinstance(node, Document):
+                entry = {"chain": _chain(node.parent), "document": [node._title, node.id, node.chtime, node.size]}
+            else:
+                entry = {"chain": _chain(node), "document": None}
+            entry.update(course=node.course.id, since=since, attempts=attempts,
+                         due=time.time() + RETRY_DELAY * 2 ** (attempts - 1))
+            self._entries[node_key] = entry
+            log.info("Retrying %s in %d seconds" % (node_key, entry["due"] - time.time()))
+        self._save()
+
+    def since(self, node_key):
+        """
+        time of the last check a pending entry was compared against, None if there is no such entry
+        """
+        entry = self._entries.get(node_key)
+        return entry["since"] if entry is not None else None
+
+    def resolve(self, node_key):
+        """
+        remove an entry after it succeeded
+        """
+        if self._entries.pop(node_key, None) is not None:
+            self._save()
+
+    def due(self, courses):
+        """
+        list of (key, node, since) for all entries that are due. courses maps course ids to courses and is used to rebuild
+        the nodes. Entries of courses that no longer exist are dropped.
+        """
+        result = []
+        for node_key, entry in list(self._entries.items()):
+            if entry["due"] > time.time():
+                continue
+            node = courses.get(entry["course"])
+            if node is None:
+                self.resolve(node_key)
+                continue
+            for folder_id, title in entry["chain"]:
+                node = Folder(node, title, folder_id)
+            if entry["document"] is not None:
+                node = Document(node, *entry["document"])
+            result.append((node_key, node, entry["since"]))
+        return result
@@ -46,6 +46,30 @@ selected_courses:
 namemap:
   '_course': '_title' # this is the format you should use. isn't yaml beautiful?
 
+# Rules deciding which folders and documents are downloaded. Patterns are globs matched against the path inside the
+# course (e.g. 'Recordings/*' or '*.mp4'), max_size is given in MB and folders can be excluded by their id. If include
+# is not empty only documents matching one of its patterns are downloaded. Rules below courses only apply to that course.
+filters:
+  include: []
+  exclude: []
+  exclude_extensions: []
+  exclude_folders: []
+  max_size: 0 # no limit
+  courses:
+    '_course_id':
+      exclude_extensions: ['.mp4']
+
+# Only record the documents of your courses instead of downloading all of them. Documents of courses in the current
+# semester are still downloaded automatically, everything else is downloaded with studdp fetch PATH.
+on_demand: false
+
+# Maximum disk space in MB used by downloaded documents in on_demand mode. Once it is exceeded the least recently
+# accessed documents are deleted. They can be downloaded again with studdp fetch. 0 means no limit.
+quota: 0
+
+# Extract text from downloaded pdf, office, text and archive files into a search index. Use studdp search to query it.
+index: true
+
 # Time of last check. You should normally not touch this
 last_check: 0
 """
@@ -94,6 +118,9 @@ class Config(metaclass=Singleton):
     def values(self):
         return self._settings.values()
 
+    def get(self, key, default=None):
+        return self._settings.get(key, default)
+
     @property
     def auth(self):
         """
@@ -146,6 +173,15 @@ class Config(metaclass=Singleton):
         with open(file, 'r') as f:
             self._settings = yaml.load(f, yaml.RoundTripLoader)
 
+    def reload(self, file=CONFIG_FILE):
+        """
+        reload the configuration file while keeping the time of the last check, which is only tracked in memory.
+        """
+        last_check = self._settings["last_check"]
+        self.load(file)
+        self._settings["last_check"] = last_check
+        log.info("Reloaded configuration from %s" % file)
+
     def save(self, file=CONFIG_FILE):
         """
         Save configuration to provided path as a yaml file
@@ -0,0 +1,90 @@
+"""
+Local control interface for the studdp daemon. The daemon listens on a unix domain socket under $HOME/.studdp and accepts
+one json encoded command per connection. Every command is answered with a single json encoded response.
+"""
+import os
+import json
+import socket
+import socketserver
+import threading
+import logging
+from os.path import expanduser, join
+
+log = logging.getLogger(__name__)
+
+SOCKET_PATH = expanduser(join('~', '.studdp', 'studdp.sock'))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Reads a single command from the socket, dispatches it to the main loop and writes the response back.
+    """
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            response = self.server.dispatch(request)
+        except Exception as e:
+            log.exception("Failed to handle control request")
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server that forwards commands to a running main loop. Use start() to serve in a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, loop, path=SOCKET_PATH):
+        self.loop = loop
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+    def dispatch(self, request):
+        """
+        Execute a command on the main loop. Known commands are sync, status, reload and stop.
+        """
+        command = request.get("command")
+        if command == "sync":
+            self.loop.sync(request.get("target"))
+        elif command == "status":
+            return {"ok": True, "status": self.loop.status()}
+        elif command == "reload":
+            self.loop.reload()
+        elif command == "stop":
+            self.loop.stop()
+        else:
+            return {"ok": False, "error": "Unknown command %s" % command}
+        return {"ok": True}
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="studdp-control", daemon=True)
+        thread.start()
+        log.info("Listening for commands on %s" % self.path)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def send(command, path=SOCKET_PATH, **kwargs):
+    """
+    Send a command to a running daemon and return its response. Raises ConnectionError if no daemon is listening.
+    """
+    request = dict(kwargs, command=command)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline().decode("utf-8"))
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise ConnectionError("No studdp daemon is listening on %s" % path) from e
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error"))
+    return response
@@ -0,0 +1,94 @@
+"""
+Include and exclude rules for folders and documents. The rules are configured globally and per course in the filters section
+of the configuration and compiled once per course into a Filter, which is applied while crawling so that excluded folders are
+never listed and excluded documents never downloaded.
+"""
+import re
+import logging
+from fnmatch import translate
+from .config import Config
+
+c = Config()
+log = logging.getLogger(__name__)
+
+_cache = {}
+
+
+def _compile(patterns):
+    """
+    combine a list of glob patterns into a single case insensitive regular expression. Returns None for an empty list.
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(translate(pattern) for pattern in patterns), re.IGNORECASE)
+
+
+def _relative_path(node):
+    """
+    path of a node inside its course, e.g. folder/subfolder/document.pdf
+    """
+    parts = []
+    while node.parent is not None:
+        parts.append(node.title)
+        node = node.parent
+    return "/".join(reversed(parts))
+
+
+class Filter:
+    """
+    Compiled set of rules. Paths are matched relative to the course and with the same names that are used on disk.
+    """
+    def __init__(self, include=(), exclude=(), extensions=(), folders=(), max_size=0):
+        self._include = _compile(include)
+        self._exclude = _compile(exclude)
+        self._extensions = tuple(extension.lower() for extension in extensions)
+        self._folders = frozenset(str(folder) for folder in folders)
+        self._max_size = max_size * 1024 * 1024
+
+    def allows_folder(self, folder):
+        """
+        checks if a folder should be listed. A folder is excluded by its id or by an exclude pattern matching either its path
+        or everything below it.
+        """
+        if folder.id in self._folders:
+            return False
+        if self._exclude is None:
+            return True
+        path = _relative_path(folder)
+        return not (self._exclude.match(path) or self._exclude.match(path + "/"))
+
+    def allows_document(self, document):
+        """
+        checks if a document should be downloaded
+        """
+        if self._max_size and document.size > self._max_size:
+            return False
+        if self._extensions and document.title.lower().endswith(self._extensions):
+            return False
+        path = _relative_path(document)
+        if self._exclude is not None and self._exclude.match(path):
+            return False
+        return self._include is None or bool(self._include.match(path))
+
+
+def for_course(course):
+    """
+    the Filter for a course, combining the global rules with the rules configured for this course
+    """
+    if course.id not in _cache:
+        rules = c.get("filters") or {}
+        local = (rules.get("courses") or {}).get(course.id) or {}
+        _cache[course.id] = Filter(
+            include=list(rules.get("include") or []) + list(local.get("include") or []),
+            exclude=list(rules.get("exclude") or []) + list(local.get("exclude") or []),
+            extensions=list(rules.get("exclude_extensions") or []) + list(local.get("exclude_extensions") or []),
+            folders=list(rules.get("exclude_folders") or []) + list(local.get("exclude_folders") or []),
+            max_size=local.get("max_size", rules.get("max_size", 0)) or 0)
+    return _cache[course.id]
+
+
+def reset():
+    """
+    forget all compiled filters. Has to be called after the configuration was reloaded.
+    """
+    _cache.clear()
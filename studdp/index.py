@@ -0,0 +1,228 @@
+"""
+Post download processing for studdp. Downloaded files are handed to a pool of worker processes which unpack archives and
+extract text from pdf, office and plain text documents. The text is stored in a sqlite full text index that can be queried
+with studdp search.
+
+Processors are looked up by file extension. Additional ones can be added with the register decorator; they have to be
+module level functions that take a path and return a list of (path, text) tuples.
+"""
+import os
+import re
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import zipfile
+import logging
+import threading
+import subprocess
+from os.path import expanduser, join
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+log = logging.getLogger(__name__)
+
+INDEX_PATH = expanduser(join('~', '.studdp', 'index.db'))
+
+PROCESSORS = {}
+
+_XML_TAG = re.compile(r"<[^>]+>")
+
+
+def register(*extensions):
+    """
+    decorator registering a processor for the given file extensions
+    """
+    def decorator(func):
+        for extension in extensions:
+            PROCESSORS[extension.lower()] = func
+        return func
+    return decorator
+
+
+def _extension(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def process(path):
+    """
+    run the processor matching the extension of path. Returns a list of (path, mtime, text) tuples which includes path itself,
+    possibly with empty text, so it is not processed again until it changes. Runs in a worker process.
+    """
+    processor = PROCESSORS.get(_extension(path))
+    if processor is None:
+        return []
+    return [(p, os.path.getmtime(p), text) for p, text in processor(path)]
+
+
+@register(".txt", ".md", ".csv", ".tex", ".py", ".java", ".c", ".h", ".html")
+def _plain_text(path):
+    with open(path, "r", errors="replace") as f:
+        return [(path, f.read())]
+
+
+@register(".pdf")
+def _pdf(path):
+    if shutil.which("pdftotext") is None:
+        log.debug("pdftotext not found, not indexing %s" % path)
+        return []
+    result = subprocess.run(["pdftotext", "-q", "-enc", "UTF-8", path, "-"], stdout=subprocess.PIPE)
+    return [(path, result.stdout.decode("utf-8", errors="replace"))]
+
+
+@register(".docx", ".pptx", ".xlsx", ".odt", ".odp", ".ods")
+def _office(path):
+    """
+    office open xml and open document files are zip archives of xml files. The text is taken from the xml content parts.
+    """
+    parts = []
+    with zipfile.ZipFile(path) as archive:
+        for name in sorted(archive.namelist()):
+            if name.endswith(".xml") and (name.startswith(("word/", "ppt/slides/", "xl/sharedStrings")) or name == "content.xml"):
+                parts.append(_XML_TAG.sub(" ", archive.read(name).decode("utf-8", errors="replace")))
+    return [(path, " ".join(" ".join(parts).split()))]
+
+
+@register(".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz")
+def _archive(path):
+    """
+    unpack an archive into a temporary directory and process all contained files. Their text is indexed under the archive
+    itself, each part preceded by the name of the file it was found in, so nothing is left on disk.
+    """
+    with tempfile.TemporaryDirectory(prefix="studdp-") as target:
+        root = os.path.realpath(target)
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                members = [m for m in archive.namelist() if os.path.realpath(join(target, m)).startswith(root + os.sep)]
+                archive.extractall(target, members)
+        elif tarfile.is_tarfile(path):
+            with tarfile.open(path) as archive:
+                members = [m for m in archive.getmembers()
+                           if (m.isfile() or m.isdir()) and os.path.realpath(join(target, m.name)).startswith(root + os.sep)]
+                archive.extractall(target, members)
+        else:
+            return []
+        parts = []
+        for dirpath, dirnames, filenames in os.walk(target):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                member = join(dirpath, filename)
+                parts += ["%s\n%s" % (os.path.relpath(member, target), text) for _, _, text in process(member) if text]
+    return [(path, "\n\n".join(parts))]
+
+
+class Index:
+    """
+    sqlite full text index of processed files. Remembers the modification time of every file so unchanged files are skipped.
+    """
+    def __init__(self, path=INDEX_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL)")
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts5(path UNINDEXED, text)")
+
+    def is_current(self, path):
+        """
+        checks if path was indexed since it was last modified
+        """
+        with self._lock:
+            row = self._db.execute("SELECT mtime FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] >= os.path.getmtime(path)
+
+    def add(self, path, mtime, text):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM contents WHERE path = ?", (path,))
+            if text:
+                self._db.execute("INSERT INTO contents (path, text) VALUES (?, ?)", (path, text))
+            self._db.execute("INSERT OR REPLACE INTO files (path, mtime) VALUES (?, ?)", (path, mtime))
+
+    def remove(self, path):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM contents WHERE path = ?", (path,))
+            self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def search(self, query, limit=20):
+        """
+        list of (path, snippet) tuples for the best matches of a sqlite fts query. Queries that are not valid fts syntax, like
+        back-propagation or C++, are searched as a phrase. Files that no longer exist, e.g. because they were evicted, are
+        removed from the index and left out.
+        """
+        try:
+            results = self._match(query, limit)
+        except sqlite3.OperationalError:
+            results = self._match('"%s"' % query.replace('"', '""'), limit)
+        missing = {path for path, _ in results if not os.path.exists(path)}
+        for path in missing:
+            self.remove(path)
+        return [result for result in results if result[0] not in missing]
+
+    def _match(self, query, limit):
+        with self._lock:
+            return self._db.execute(
+                "SELECT path, snippet(contents, 1, '[', ']', '...', 12) FROM contents WHERE contents MATCH ? "
+                "ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+
+    def close(self):
+        self._db.close()
+
+
+class Pipeline:
+    """
+    hands downloaded files to a process pool and feeds the results into the index. Files that are already indexed in their
+    current version or that no processor handles are skipped.
+    """
+    def __init__(self, workers=None, index=None):
+        self.index = index or Index()
+        self._workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, path):
+        """
+        queue a file for processing. A worker that died, e.g. because it ran out of memory, breaks the pool; it is replaced by a
+        new one so processing never fails the download that submitted the file.
+        """
+        if _extension(path) not in PROCESSORS or self.index.is_current(path):
+            return
+        with self._lock:
+            self._pending += 1
+        try:
+            try:
+                future = self._executor.submit(process, path)
+            except BrokenProcessPool:
+                log.warning("Worker process died, restarting the processing pool")
+                self._executor.shutdown(wait=False)
+                self._executor = ProcessPoolExecutor(max_workers=self._workers)
+                future = self._executor.submit(process, path)
+        except Exception:
+            log.exception("Submitting %s for processing failed" % path)
+            with self._lock:
+                self._pending -= 1
+            return
+        future.add_done_callback(lambda future: self._done(path, future))
+
+    def _done(self, path, future):
+        with self._lock:
+            self._pending -= 1
+        try:
+            results = future.result()
+        except Exception:
+            log.exception("Processing %s failed" % path)
+            return
+        for entry in results:
+            self.index.add(*entry)
+        log.debug("Indexed %s" % path)
+
+    def close(self):
+        """
+        wait for all submitted files to be processed
+        """
+        self._executor.shutdown(wait=True)
+        self.index.close()
@@ -16,18 +16,35 @@ This module also contains the client for the stud.ip rest api as it is closely c
 """
 
 import os
+import time
 from os.path import join
 import logging
 import json
-import shutil
+import hashlib
+import collections
 import requests as r
 from memorised.decorators import memorise
 from werkzeug.utils import secure_filename
 from .config import Config
+from . import filters
 
 c = Config()
 log = logging.getLogger(__name__)
 
+BUFFER_SIZE = 1024 * 1024
+
+
+class Download(collections.namedtuple("Download", ["path", "size", "sha256", "seconds"])):
+    """
+    Result of a finished download
+    """
+    @property
+    def throughput(self):
+        """
+        transfer rate in MB/s
+        """
+        return self.size / 1024 / 1024 / max(self.seconds, 1e-6)
+
 
 class BaseNode:
     """
@@ -99,6 +116,19 @@ class Folder(BaseNode):
                 tree += entry.deep_documents
         return tree
 
+    def find(self, folder_id):
+        """
+        search the subtree of this node for the folder with the given id. Returns None if no such folder exists.
+        """
+        if self.id == folder_id:
+            return self
+        for entry in self.contents:
+            if isinstance(entry, Folder):
+                found = entry.find(folder_id)
+                if found is not None:
+                    return found
+        return None
+
 
 class Course(Folder):
     """
@@ -134,16 +164,18 @@ class Document(BaseNode):
     """
     Node representing a Document(leaf). Notable properties are a different format of responses and an option to download.
     """
-    def __init__(self, parent, title, object_id, chtime):
+    def __init__(self, parent, title, object_id, chtime, size=0):
         super().__init__(parent, title, object_id)
         self.chtime = chtime
+        self.size = size
 
     @classmethod
     def from_response(cls, http_response, parent):
-        return cls(parent, http_response["filename"], http_response["document_id"], int(http_response["chdate"]))
+        return cls(parent, http_response["filename"], http_response["document_id"], int(http_response["chdate"]),
+                   int(http_response.get("filesize") or 0))
 
-    def download(self, overwrite=True):
-        client.download_document(self, overwrite)
+    def download(self, overwrite=True, since=None):
+        return client.download_document(self, overwrite, since=since)
 
     @property
     def path(self):
@@ -156,7 +188,7 @@ class _APIClient:
     be used.
     """
     def __init__(self):
-        pass
+        self._buffer = memoryview(bytearray(BUFFER_SIZE))
 
     @staticmethod
     def _url(route):
@@ -175,6 +207,7 @@ class _APIClient:
     def get_contents(self, folder: Folder):
         """
         List all contents of a folder. Returns a list of all Documents and Folders (in this order) in the folder.
+        Documents and folders excluded by the filters configured for the course are left out.
         """
         log.debug("Listing Contents of %s/%s" % (folder.course.id, folder.id))
         if isinstance(folder, Course):
@@ -187,25 +220,72 @@ class _APIClient:
 
         folders = [Folder.from_response(response, folder) for response in response["folders"]]
 
+        rules = filters.for_course(folder.course)
+        documents = [document for document in documents if rules.allows_document(document)]
+        folders = [folder for folder in folders if rules.allows_folder(folder)]
+
         return documents + folders
 
     @staticmethod
-    def modified(document: Document):
-        return int(document.chtime) > c["last_check"]
+    def modified(document: Document, since=None):
+        """
+        checks if a document was changed after since, which defaults to the time of the last check
+        """
+        return int(document.chtime) > (c["last_check"] if since is None else since)
+
+    @staticmethod
+    def local_path(document: Document):
+        """
+        The path a document is stored at: base_path + stud.ip path + filename
+        """
+        return os.path.join(os.path.expanduser(c["base_path"]), document.path, document.title)
 
-    def download_document(self, document: Document, overwrite=True, path=None):
+    def download_document(self, document: Document, overwrite=True, path=None, since=None):
         """
         Download a document to the given path. if no path is provided the path is constructed frome the base_url + stud.ip path + filename.
-        If overwrite is set the local version will be overwritten if the file was changed on studip since the last check
+        If overwrite is set the local version will be overwritten if the file was changed on studip since the last check or,
+        if given, since.
+        Returns a Download if the file was downloaded, None otherwise.
         """
         if not path:
             path = os.path.join(os.path.expanduser(c["base_path"]), document.path)
-        if (self.modified(document) and overwrite) or not os.path.exists(join(path, document.title)):
-            log.info("Downloading %s" % join(path, document.title))
-            file = self._get('/api/documents/%s/download' % document.id, stream=True)
-            os.makedirs(path, exist_ok=True)
-            with open(join(path, document.title), 'wb') as f:
-                shutil.copyfileobj(file.raw, f)
+        if (self.modified(document, since) and overwrite) or not os.path.exists(join(path, document.title)):
+            return self.download_file(document.id, join(path, document.title), document.size)
+        return None
+
+    def download_file(self, document_id, path, size=0):
+        """
+        Download the document with the given id to path, regardless of what is stored there. The response is decoded and
+        hashed while it is copied into a reused buffer and written to a temporary file that only replaces path once the
+        number of bytes matches the size reported by stud.ip. Returns a Download.
+        """
+        log.info("Downloading %s" % path)
+        start = time.time()
+        sha256 = hashlib.sha256()
+        written = 0
+        with self._get('/api/documents/%s/download' % document_id, stream=True) as file:
+            file.raise_for_status()
+            file.raw.decode_content = True
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(path + ".part", 'wb') as f:
+                    while True:
+                        read = file.raw.readinto(self._buffer)
+                        if not read:
+                            break
+                        chunk = self._buffer[:read]
+                        sha256.update(chunk)
+                        f.write(chunk)
+                        written += read
+                if size and written != size:
+                    raise IOError("Expected %d bytes for %s but received %d" % (size, path, written))
+                os.replace(path + ".part", path)
+            finally:
+                if os.path.exists(path + ".part"):
+                    os.remove(path + ".part")
+        download = Download(path, written, sha256.hexdigest(), time.time() - start)
+        log.info("Downloaded %s (%d bytes, %.2f MB/s, sha256 %s)" % (path, written, download.throughput, download.sha256))
+        return download
 
     def get_semester_title(self, node: BaseNode):
         """
@@ -214,9 +294,19 @@ class _APIClient:
         log.debug("Getting Semester Title for %s" % node.course.id)
         return self._get_semester_from_id(node.course.semester)
 
-    @memorise()
+    def is_current_semester(self, node: BaseNode):
+        """
+        checks if the semester of a node is currently running
+        """
+        semester = self._get_semester(node.course.semester)
+        return int(semester["begin"]) <= time.time() <= int(semester["end"])
+
     def _get_semester_from_id(self, semester_id):
-        return self._get("/api/semesters/%s" % semester_id).json()["semester"]["title"]
+        return self._get_semester(semester_id)["title"]
+
+    @memorise()
+    def _get_semester(self, semester_id):
+        return self._get("/api/semesters/%s" % semester_id).json()["semester"]
 
     def get_courses(self):
         """
@@ -0,0 +1,91 @@
+"""
+Profiling support for a single sync cycle. The cycle runs under cProfile and tracemalloc and can additionally be sampled by a
+background thread. All reports are written to $HOME/.studdp and are named after the time the profile was started.
+"""
+import sys
+import time
+import cProfile
+import logging
+import threading
+import traceback
+import tracemalloc
+import collections
+from os.path import expanduser, join
+
+log = logging.getLogger(__name__)
+
+PROFILE_DIR = expanduser(join('~', '.studdp'))
+
+
+class _Sampler(threading.Thread):
+    """
+    Thread that periodically records the stack of another thread. The result is written in the collapsed stack format used
+    by flamegraph tools. Uses sys._current_frames so it can run alongside cProfile.
+    """
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(name="studdp-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = traceback.StackSummary.extract(traceback.walk_stack(frame), lookup_lines=False)
+            self.stacks[";".join("%s:%s" % (entry.filename, entry.name) for entry in reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def write(self, file):
+        with open(file, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("%s %d\n" % (stack, count))
+
+
+def profile(task, top=25, sample=False):
+    """
+    run task once while profiling it. task is expected to be a _MainLoop whose course_times are included in the report.
+    Returns the common prefix of all files that were written.
+    """
+    prefix = join(PROFILE_DIR, "profile-%s" % time.strftime("%Y%m%d-%H%M%S"))
+    sampler = _Sampler(threading.get_ident()) if sample else None
+    profiler = cProfile.Profile()
+
+    tracemalloc.start()
+    if sampler:
+        sampler.start()
+    start = time.time()
+    profiler.enable()
+    try:
+        task()
+    finally:
+        profiler.disable()
+        duration = time.time() - start
+        if sampler:
+            sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    profiler.dump_stats(prefix + ".pstats")
+
+    with open(prefix + "-allocations.txt", "w") as f:
+        f.write("Peak traced memory: %.1f KiB\n\n" % (peak / 1024))
+        for stat in snapshot.statistics("lineno")[:top]:
+            f.write("%s\n" % stat)
+
+    with open(prefix + "-courses.txt", "w") as f:
+        for course, seconds in sorted(task.course_times.items(), key=lambda item: -item[1]):
+            f.write("%10.3fs  %s\n" % (seconds, course))
+        f.write("%10.3fs  total\n" % duration)
+
+    if sampler:
+        sampler.write(prefix + "-samples.txt")
+
+    log.info("Wrote profile to %s*" % prefix)
+    return prefix
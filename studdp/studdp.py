@@ -9,7 +9,18 @@ import daemon
 from daemon.pidfile import PIDLockFile
 import time
 import logging
-from .model import client
+import threading
+import collections
+import sqlite3
+import shutil
+import tempfile
+from .model import client, Document
+from . import control
+from . import filters
+from .index import Index, Pipeline
+from .cache import Store
+from .profiling import profile
+from .checkpoint import Checkpoint, RetryQueue, key
 from .config import Config
 from . import LOG_PATH
 
@@ -20,13 +31,13 @@ PID_FILE = expanduser(join('~', '.studdp', 'studdp.pid'))
 
 
 def _parse_args():
-    parser = optparse.OptionParser()
+    parser = optparse.OptionParser(usage="%prog [options] [sync [COURSE_ID[/FOLDER_ID]] | status | reload | search QUERY | fetch PATH]")
     parser.add_option("-c", "--config",
                       action="store_true", dest="select", default=False,
                       help="change course selection")
     parser.add_option("-s", "--stop",
                       action="store_true", dest="stop", default=False,
-                      help="stop the daemon process")
+                      help="stop the daemon process after the running download")
     parser.add_option("-d", "--daemonize",
                       action="store_true", dest="daemonize", default=False,
                       help="start as daemon. Use studdp -s to stop daemon.")
@@ -36,43 +47,402 @@ def _parse_args():
     parser.add_option("--password",
                       action="store_true", dest="change_password", default=False,
                       help="change the password entry in the keyring")
+    parser.add_option("--profile",
+                      action="store_true", dest="profile", default=False,
+                      help="run a single check under cProfile and tracemalloc and write the reports to ~/.studdp")
+    parser.add_option("--sample",
+                      action="store_true", dest="sample", default=False,
+                      help="additionally sample the call stack while profiling")
+    parser.add_option("--profile-top",
+                      type="int", dest="profile_top", default=25,
+                      help="number of allocation sites to report when profiling [default: %default]")
     return parser.parse_args()
 
 
 class _MainLoop:
     """
     Main Loop that takes care of checking whether courses need to be downloaded and takes care of general task orchestration.
+    When run as a daemon it can be controlled through the methods sync, reload and stop, which are safe to call from other threads.
+    progress and retries default to the Checkpoint and RetryQueue kept in $HOME/.studdp.
     """
 
-    def __init__(self, daemonize, overwrite):
+    def __init__(self, daemonize, overwrite, progress=None, retries=None):
         self.daemonize = daemonize
         self.overwrite = overwrite
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._reloading = threading.Event()
+        self._full_sync = threading.Event()
+        self._targets = collections.deque()
+        self._pipeline = None
+        self._store = None
+        self._progress = progress if progress is not None else Checkpoint()
+        self._retries = retries if retries is not None else RetryQueue()
+        self._courses = {}
+        self._folders = {}
+        self._state = {
+            "state": "idle",
+            "active": None,
+            "queued": 0,
+            "last_cycle": None,
+            "last_cycle_duration": None,
+            "last_download": None
+        }
+        self.course_times = {}
 
-    def __call__(self):
-        while True:
+    def sync(self, target=None):
+        """
+        request an immediate sync of a course or folder given as course_id[/folder_id]. Without a target a full cycle is started.
+        """
+        if target:
+            self._targets.append(target)
+        else:
+            self._full_sync.set()
+        self._wakeup.set()
+
+    def reload(self):
+        """
+        reload the configuration before the next download
+        """
+        self._reloading.set()
+        self._wakeup.set()
+
+    def stop(self):
+        """
+        stop the loop once the download currently in progress is finished
+        """
+        self._stopping.set()
+        self._wakeup.set()
+
+    def status(self):
+        """
+        dict describing what the loop is currently doing
+        """
+        processing = self._pipeline.pending if self._pipeline else 0
+        return dict(self._state, pending_syncs=len(self._targets), processing=processing, retries=len(self._retries))
+
+    def _should_stop(self):
+        """
+        called between downloads. Applies a pending reload and returns True if the loop should stop.
+        """
+        if self._reloading.is_set():
+            self._reloading.clear()
+            c.reload()
+            filters.reset()
+            self._configure()
+        return self._stopping.is_set()
+
+    def _configure(self):
+        """
+        create, adjust or close the index pipeline and the document store according to the index, on_demand and quota
+        settings
+        """
+        if c.get("index", True) and self._pipeline is None:
+            self._pipeline = Pipeline()
+        elif not c.get("index", True) and self._pipeline is not None:
+            self._pipeline.close()
+            self._pipeline = None
+        if c.get("on_demand", False):
+            if self._store is None:
+                self._store = Store()
+            self._store.quota = c.get("quota", 0) * 1024 * 1024
+            self._store.evict()
+        elif self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _since(self, node, since):
+        """
+        the time of the last check a node has to be compared against. A pending retry keeps the time of the check it failed
+        in, so changes it missed are not skipped because the last check moved on in the meantime.
+        """
+        queued = self._retries.since(key(node))
+        return since if queued is None else min(since, queued)
+
+    def _download(self, documents, since):
+        """
+        download a list of documents. Documents that fail are put into the retry queue. Returns False if the loop was stopped
+        before all documents were handled.
+        """
+        self._state["queued"] = len(documents)
+        wanted = set()
+        if self._store and documents:
+            try:
+                auto = client.is_current_semester(documents[0])
+                wanted = self._store.update([(document, client.local_path(document)) for document in documents], auto)
+                wanted.update(document.id for document in documents if self._retries.since(key(document)) is not None
+                              and (auto or os.path.exists(client.local_path(document))))
+            except Exception:
+                log.exception("Recording documents of %s failed" % documents[0].path)
+                self._retries.add_all(documents, since)
+                return True
+        try:
+            for document in documents:
+                if self._should_stop():
+                    return False
+                self._state["active"] = join(document.path, document.title)
+                document_since = self._since(document, since)
+                try:
+                    if self._store:
+                        download = self._fetch(document, wanted)
+                    else:
+                        download = document.download(self.overwrite, document_since)
+                    self._retries.resolve(key(document))
+                except Exception:
+                    log.exception("Downloading %s failed" % self._state["active"])
+                    self._retries.add(document, document_since)
+                    download = None
+                if download:
+                    self._state["last_download"] = dict(download._asdict(), throughput=download.throughput)
+                    if self._pipeline:
+                        self._pipeline.submit(download.path)
+                self._state["queued"] -= 1
+            return True
+        finally:
+            self._state["active"] = None
+            self._state["queued"] = 0
+
+    def _walk(self, folder, since, checkpointed=True):
+        """
+        download all documents below a folder. Every finished folder is recorded in the checkpoint and, if checkpointed is
+        set, skipped if the cycle is resumed. Folders that can not be listed are put into the retry queue. Returns False if the
+        loop was stopped in the meantime.
+        """
+        if checkpointed and key(folder) in self._progress:
+            return True
+        since = self._since(folder, since)
+        try:
+            contents = folder.contents
+        except Exception:
+            log.exception("Listing %s failed" % folder.path)
+            self._retries.add(folder, since)
+            return True
+        self._retries.resolve(key(folder))
+        if not self._download([entry for entry in contents if isinstance(entry, Document)], since):
+            return False
+        for entry in contents:
+            if not isinstance(entry, Document):
+                self._folders[key(entry)] = entry
+                if not self._walk(entry, since, checkpointed):
+                    return False
+        self._progress.done(key(folder))
+        return True
+
+    def _fetch(self, document, wanted):
+        """
+        download a document in on demand mode if it is in wanted, i.e. if it is part of the current semester, the local copy
+        is outdated or an earlier download failed. The store already decided, so the download is not compared against the
+        time of the last check again.
+        """
+        if document.id not in wanted:
+            return None
+        local_path = client.local_path(document)
+        download = client.download_file(document.id, local_path, document.size)
+        self._store.fetched(local_path, download.sha256, document)
+        return download
+
+    def _sync_target(self, target):
+        """
+        sync a course or folder given as course_id[/folder_id]. Folders seen in earlier crawls are looked up directly,
+        otherwise the course is searched for the folder. Checkpoints are ignored so the target is always synced.
+        """
+        course_id, _, folder_id = target.partition("/")
+        folder = self._folders.get(target) if folder_id else self._courses.get(course_id)
+        try:
+            if folder is None:
+                course = self._courses.get(course_id) or next(
+                    (course for course in client.get_courses() if course.id == course_id), None)
+                folder = course.find(folder_id) if course is not None and folder_id else course
+        except Exception:
+            log.exception("Looking up %s for on demand sync failed" % target)
+            return True
+        if folder is None:
+            log.warning("Could not find %s for on demand sync" % target)
+            return True
+        log.info("Syncing %s on demand..." % folder.path)
+        self._state["state"] = "syncing"
+        return self._walk(folder, c["last_check"], checkpointed=False)
+
+    def _retry(self, courses):
+        """
+        handle all due entries of the retry queue. Returns False if the loop was stopped in the meantime.
+        """
+        for node_key, node, since in self._retries.due(courses):
+            log.info("Retrying %s..." % node_key)
+            if isinstance(node, Document):
+                finished = self._download([node], since)
+            else:
+                finished = self._walk(node, since)
+            if not finished:
+                return False
+        return True
+
+    def _drain(self):
+        """
+        handle all pending on demand syncs. Returns False if the loop was stopped in the meantime.
+        """
+        while self._targets:
+            if not self._sync_target(self._targets.popleft()):
+                return False
+        return True
+
+    def _cycle(self):
+        """
+        run one full check of all selected courses. Returns False if the loop was stopped in the meantime.
+        """
+        self._state["state"] = "syncing"
+        start = time.time()
+        self.course_times = {}
+        try:
             courses = client.get_courses()
+        except Exception:
+            log.exception("Listing courses failed")
+            self._state["state"] = "idle"
+            return True
+        self._courses = {course.id: course for course in courses}
 
-            for course in courses:
-                if not c.is_selected(course):
-                    log.debug("Skipping files for %s" % course)
-                    continue
+        since = self._progress.start(c["last_check"], c["interval"])
+        if not self._retry(self._courses):
+            self._progress.close()
+            return False
+
+        for course in courses:
+            if not self._drain():
+                self._progress.close()
+                return False
+            if not c.is_selected(course):
+                log.debug("Skipping files for %s" % course)
+                continue
+            course_start = time.time()
+            try:
                 log.info("Checking files for %s..." % course)
-                for document in course.deep_documents:
-                    document.download(self.overwrite)
+                finished = self._walk(course, since)
+                self.course_times[str(course)] = time.time() - course_start
+            except Exception:
+                log.exception("Checking %s failed" % course.id)
+                self._retries.add(course, since)
+                finished = True
+            if not finished:
+                self._progress.close()
+                return False
+
+        self._progress.finish()
+        c.update_time()
+        self._state.update(state="idle", last_cycle=time.time(), last_cycle_duration=time.time() - start)
+        log.info("Finished checking.")
+        return True
 
-            c.update_time()
-            log.info("Finished checking.")
-            if not self.daemonize:
-                return
-            log.info("Going to sleep for %d" % c["interval"])
-            time.sleep(c["interval"])
+    def _sleep(self):
+        """
+        wait for the next cycle while handling on demand syncs. Returns False if the loop should stop.
+        """
+        log.info("Going to sleep for %d" % c["interval"])
+        self._state["state"] = "sleeping"
+        deadline = time.time() + c["interval"]
+        while self._wakeup.wait(max(0, deadline - time.time())):
+            self._wakeup.clear()
+            if self._should_stop() or not self._drain():
+                return False
+            self._state["state"] = "sleeping"
+            if self._full_sync.is_set():
+                break
+        self._full_sync.clear()
+        return not self._should_stop()
+
+    def __call__(self):
+        self._configure()
+        try:
+            while self._cycle() and self.daemonize and self._sleep():
+                pass
+        finally:
+            if self._pipeline:
+                self._pipeline.close()
+                self._pipeline = None
+            if self._store:
+                self._store.close()
+                self._store = None
+        self._state["state"] = "stopped"
+        if self._stopping.is_set():
+            log.info("Stopped.")
+
+
+def _search(args):
+    """
+    query the full text index of downloaded files
+    """
+    if not args:
+        log.error("Usage: studdp search QUERY")
+        return 1
+    index = Index()
+    try:
+        results = index.search(" ".join(args))
+    except sqlite3.OperationalError as e:
+        log.error("Invalid search query: %s" % e)
+        return 1
+    finally:
+        index.close()
+    for path, snippet in results:
+        print("%s\n    %s" % (path, " ".join(snippet.split())))
+    return 0
+
+
+def _fetch(args):
+    """
+    download documents recorded in on demand mode. Paths are taken relative to base_path unless they are absolute.
+    """
+    if not args:
+        log.error("Usage: studdp fetch PATH")
+        return 1
+    store = Store(c.get("quota", 0) * 1024 * 1024)
+    try:
+        for arg in args:
+            documents = store.lookup(join(expanduser(c["base_path"]), expanduser(arg)))
+            if not documents:
+                log.error("No documents known under %s" % arg)
+            for document_id, path, size in documents:
+                sha256 = None
+                if not os.path.exists(path):
+                    sha256 = client.download_file(document_id, path, size).sha256
+                store.fetched(path, sha256)
+    finally:
+        store.close()
+    return 0
+
+
+def _control(args):
+    """
+    send a command given on the command line to the running daemon
+    """
+    command = args[0]
+    if command not in ("sync", "status", "reload"):
+        log.error("Unknown command %s" % command)
+        return 1
+    target = args[1] if len(args) > 1 else None
+    try:
+        response = control.send(command, target=target)
+    except (ConnectionError, RuntimeError) as e:
+        log.error(e)
+        return 1
+    if command == "status":
+        for key, value in sorted(response["status"].items()):
+            print("%s: %s" % (key, value))
+    return 0
 
 
 def main():
     """
     parse command line options and either launch some configuration dialog or start an instance of _MainLoop as a daemon
     """
-    (options, _) = _parse_args()
+    (options, args) = _parse_args()
+
+    if args and args[0] == "search":
+        sys.exit(_search(args[1:]))
+
+    if args and args[0] == "fetch":
+        sys.exit(_fetch(args[1:]))
+
+    if args:
+        sys.exit(_control(args))
 
     if options.change_password:
         c.keyring_set_password(c["username"])
@@ -85,7 +455,21 @@ def main():
         sys.exit(0)
 
     if options.stop:
-        os.system("kill -2 `cat ~/.studdp/studdp.pid`")
+        try:
+            control.send("stop")
+        except ConnectionError:
+            os.system("kill -2 `cat ~/.studdp/studdp.pid`")
+        sys.exit(0)
+
+    if options.profile:
+        # profile a full, clean cycle without resuming or touching the daemon's checkpoint and retry queue
+        scratch = tempfile.mkdtemp(prefix="studdp-profile-")
+        try:
+            task = _MainLoop(False, options.update_courses,
+                             Checkpoint(join(scratch, "checkpoint")), RetryQueue(join(scratch, "retries.json")))
+            profile(task, options.profile_top, options.sample)
+        finally:
+            shutil.rmtree(scratch)
         sys.exit(0)
 
     task = _MainLoop(options.daemonize, options.update_courses)
@@ -97,7 +481,12 @@ def main():
             handler = logging.FileHandler(LOG_PATH)
             handler.setFormatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
             log.addHandler(handler)
-            task()
+            server = control.ControlServer(task)
+            server.start()
+            try:
+                task()
+            finally:
+                server.close()
     else:
         task()
 
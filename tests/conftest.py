@@ -0,0 +1,24 @@
+"""
+studdp reads its configuration from $HOME when it is imported, so tests run against a temporary home with a minimal config.
+"""
+import os
+import tempfile
+from os.path import join
+
+HOME = tempfile.mkdtemp(prefix="studdp-test-")
+os.environ["HOME"] = HOME
+os.makedirs(join(HOME, ".config", "studdp"))
+
+with open(join(HOME, ".config", "studdp", "config.yml"), "w") as f:
+    f.write("""\
+base_address: 'http://localhost'
+base_path: '%s'
+interval: 1200
+username: 'test'
+use_keyring: false
+password: 'test'
+selected_courses: []
+namemap: {}
+index: false
+last_check: 0
+""" % join(HOME, "studip"))
@@ -0,0 +1,166 @@
+import os
+
+from studdp.cache import Store
+
+
+def _store(tmpdir, quota, files):
+    """
+    store with the given {name: (size, access time)} files fetched into tmpdir
+    """
+    store = Store(quota, str(tmpdir.join("documents.db")))
+    paths = {}
+    for name, (size, accessed) in files.items():
+        path = str(tmpdir.join(name))
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(path, (accessed, accessed))
+        with store._db:
+            store._db.execute("INSERT INTO documents (id, path, chtime, size, fetched, accessed) VALUES (?, ?, 0, ?, 1, ?)",
+                              (name, path, size, accessed))
+        paths[name] = path
+    return store, paths
+
+
+def test_evict_nothing_below_quota(tmpdir):
+    store, paths = _store(tmpdir, 30, {"a": (10, 1), "b": (10, 2)})
+    store.evict()
+    assert all(os.path.exists(path) for path in paths.values())
+    assert store.usage() == 20
+
+
+def test_evict_least_recently_accessed_first(tmpdir):
+    store, paths = _store(tmpdir, 20, {"old": (10, 1), "middle": (10, 2), "new": (10, 3)})
+    store.evict()
+    assert not os.path.exists(paths["old"])
+    assert os.path.exists(paths["middle"]) and os.path.exists(paths["new"])
+    assert store.usage() == 20
+
+
+def test_evict_respects_file_system_access_time(tmpdir):
+    store, paths = _store(tmpdir, 10, {"a": (10, 1), "b": (10, 2)})
+    os.utime(paths["a"], (100, 100))
+    store.evict()
+    assert os.path.exists(paths["a"])
+    assert not os.path.exists(paths["b"])
+
+
+def test_evict_keeps_given_path(tmpdir):
+    store, paths = _store(tmpdir, 10, {"a": (10, 1), "b": (10, 2)})
+    store.evict(keep=paths["a"])
+    assert os.path.exists(paths["a"])
+    assert not os.path.exists(paths["b"])
+
+
+def test_evicted_documents_stay_known(tmpdir):
+    store, paths = _store(tmpdir, 10, {"a": (10, 1), "b": (10, 2)})
+    store.evict()
+    assert sorted(row[0] for row in store.lookup(str(tmpdir))) == ["a", "b"]
+
+
+def test_missing_files_are_not_counted(tmpdir):
+    store, paths = _store(tmpdir, 10, {"a": (10, 1), "b": (10, 2)})
+    os.remove(paths["a"])
+    store.evict()
+    assert os.path.exists(paths["b"])
+    assert store.usage() == 10
+
+
+def test_no_quota_means_no_eviction(tmpdir):
+    store, paths = _store(tmpdir, 0, {"a": (10, 1), "b": (10, 2)})
+    store.evict()
+    assert all(os.path.exists(path) for path in paths.values())
+
+
+class _Document:
+    def __init__(self, document_id, chtime, size=10):
+        self.id = document_id
+        self.chtime = chtime
+        self.size = size
+
+
+def test_update_wants_new_documents_only_if_auto(tmpdir):
+    store = Store(0, str(tmpdir.join("documents.db")))
+    documents = [(_Document("a", 1), str(tmpdir.join("a")))]
+    assert store.update(documents) == set()
+    assert store.update([(_Document("b", 1), str(tmpdir.join("b")))], auto=True) == {"b"}
+
+
+def test_update_wants_outdated_local_copies(tmpdir):
+    store = Store(0, str(tmpdir.join("documents.db")))
+    path = str(tmpdir.join("a"))
+    store.update([(_Document("a", 1), path)])
+    open(path, "w").close()
+    assert store.update([(_Document("a", 1), path)]) == set()
+    assert store.update([(_Document("a", 2), path)]) == {"a"}
+
+
+def test_update_keeps_newer_local_copies_of_unknown_documents(tmpdir):
+    store = Store(0, str(tmpdir.join("documents.db")))
+    paths = {name: str(tmpdir.join(name)) for name in "ab"}
+    for name, mtime in (("a", 10), ("b", 1)):
+        open(paths[name], "w").close()
+        os.utime(paths[name], (mtime, mtime))
+    assert store.update([(_Document(name, 5), paths[name]) for name in "ab"]) == {"b"}
+
+
+def test_update_records_change_time_only_once_fetched(tmpdir):
+    store = Store(0, str(tmpdir.join("documents.db")))
+    document = _Document("a", 1)
+    path = str(tmpdir.join("a"))
+    assert store.update([(document, path)], auto=True) == {"a"}
+    assert store.update([(document, path)], auto=True) == {"a"}
+    open(path, "w").close()
+    store.fetched(path, document=document)
+    assert store.update([(document, path)], auto=True) == set()
+
+
+def test_documents_may_share_a_path(tmpdir):
+    store = Store(0, str(tmpdir.join("documents.db")))
+    path = str(tmpdir.join("a"))
+    documents = [_Document("a", 1), _Document("b", 1)]
+    assert store.update([(document, path) for document in documents], auto=True) == {"a", "b"}
+    open(path, "w").write("x" * 10)
+    for document in documents:
+        store.fetched(path, document=document)
+    assert store.update([(document, path) for document in documents], auto=True) == set()
+    assert store.usage() == 10
+
+
+def test_update_writes_nothing_if_unchanged(tmpdir):
+    store = Store(0, str(tmpdir.join("documents.db")))
+    documents = [(_Document(str(i), 1), str(tmpdir.join(str(i)))) for i in range(1000)]
+    store.update(documents)
+    changes = store._db.total_changes
+    store.update(documents)
+    assert store._db.total_changes == changes
+    store.update(documents[:1] + [(_Document("1", 2), documents[1][1])])
+    assert store._db.total_changes == changes + 1
+
+
+def test_fetched_keeps_sha256(tmpdir):
+    store, paths = _store(tmpdir, 0, {"a": (10, 1)})
+    store.fetched(paths["a"], "abc")
+    assert store.sha256(paths["a"]) == "abc"
+    store.fetched(paths["a"])
+    assert store.sha256(paths["a"]) == "abc"
+
+
+def test_sha256_column_is_added_to_old_stores(tmpdir):
+    import sqlite3
+    path = str(tmpdir.join("documents.db"))
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE documents (id TEXT PRIMARY KEY, path TEXT UNIQUE, chtime INTEGER, size INTEGER, "
+                   "fetched INTEGER DEFAULT 0, accessed REAL DEFAULT 0)")
+    assert Store(0, path).sha256("missing") is None
+
+
+def test_unique_paths_are_dropped_from_old_stores(tmpdir):
+    import sqlite3
+    path = str(tmpdir.join("documents.db"))
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE documents (id TEXT PRIMARY KEY, path TEXT UNIQUE, chtime INTEGER, size INTEGER, "
+                   "fetched INTEGER DEFAULT 0, accessed REAL DEFAULT 0, sha256 TEXT)")
+        db.execute("INSERT INTO documents (id, path, chtime, size) VALUES ('a', 'a', 1, 10)")
+    store = Store(0, path)
+    store.update([(_Document("b", 1), "a")])
+    assert store.lookup("a") == [("a", "a", 10), ("b", "a", 10)]
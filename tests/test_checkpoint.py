@@ -0,0 +1,128 @@
+import time
+import json
+from os.path import join
+
+import pytest
+
+from studdp import checkpoint
+from studdp.checkpoint import Checkpoint, RetryQueue, key
+from studdp.model import Course, Folder, Document
+
+
+@pytest.fixture
+def course():
+    return Course("Course", "course", "semester")
+
+
+def test_checkpoint_starts_fresh_cycle(tmpdir):
+    progress = Checkpoint(str(tmpdir.join("checkpoint")))
+    assert progress.start(42, 1200) == 42
+    assert "course/folder" not in progress
+
+
+def test_checkpoint_resumes_unfinished_cycle(tmpdir):
+    path = str(tmpdir.join("checkpoint"))
+    progress = Checkpoint(path)
+    progress.start(42, 1200)
+    progress.done("course/folder")
+    progress.close()
+
+    resumed = Checkpoint(path)
+    assert resumed.start(100, 1200) == 42
+    assert "course/folder" in resumed
+
+
+def test_checkpoint_ignores_old_cycle(tmpdir):
+    path = str(tmpdir.join("checkpoint"))
+    with open(path, "w") as f:
+        f.write(json.dumps({"started": time.time() - 5000, "since": 42}) + "\ncourse/folder\n")
+    progress = Checkpoint(path)
+    assert progress.start(100, 1200) == 100
+    assert "course/folder" not in progress
+
+
+def test_finished_checkpoint_is_not_resumed(tmpdir):
+    path = str(tmpdir.join("checkpoint"))
+    progress = Checkpoint(path)
+    progress.start(42, 1200)
+    progress.done("course/folder")
+    progress.finish()
+    assert Checkpoint(path).start(100, 1200) == 100
+
+
+def test_done_outside_cycle_is_ignored(tmpdir):
+    progress = Checkpoint(str(tmpdir.join("checkpoint")))
+    progress.done("course/folder")
+    assert "course/folder" not in progress
+
+
+def test_retry_backoff_doubles(tmpdir, course):
+    retries = RetryQueue(str(tmpdir.join("retries.json")))
+    folder = Folder(course, "Folder", "folder")
+    retries.add(folder, 42)
+    first = retries._entries[key(folder)]["due"] - time.time()
+    retries.add(folder, 42)
+    second = retries._entries[key(folder)]["due"] - time.time()
+    assert first == pytest.approx(checkpoint.RETRY_DELAY, abs=1)
+    assert second == pytest.approx(2 * checkpoint.RETRY_DELAY, abs=1)
+
+
+def test_retry_gives_up_after_max_attempts(tmpdir, course):
+    retries = RetryQueue(str(tmpdir.join("retries.json")))
+    folder = Folder(course, "Folder", "folder")
+    for _ in range(checkpoint.MAX_ATTEMPTS + 1):
+        retries.add(folder, 42)
+    assert len(retries) == 0
+
+
+def test_add_all_writes_the_queue_once(tmpdir, course, monkeypatch):
+    retries = RetryQueue(str(tmpdir.join("retries.json")))
+    folder = Folder(course, "Folder", "folder")
+    saves = []
+    monkeypatch.setattr(retries, "_save", lambda: saves.append(1))
+    retries.add_all([Document(folder, "%d.pdf" % i, str(i), 1, 1) for i in range(100)], 42)
+    assert len(saves) == 1
+    assert len(retries) == 100
+
+
+def test_retry_queue_persists_and_rebuilds_nodes(tmpdir, course):
+    path = str(tmpdir.join("retries.json"))
+    retries = RetryQueue(path)
+    folder = Folder(Folder(course, "Outer", "outer"), "Inner", "inner")
+    document = Document(folder, "slides.pdf", "document", 1234, 99)
+    retries.add(folder, 42)
+    retries.add(document, 43)
+    for entry in retries._entries.values():
+        entry["due"] = 0
+    retries._save()
+
+    due = {node_key: (node, since) for node_key, node, since in RetryQueue(path).due({course.id: course})}
+    node, since = due[key(folder)]
+    assert isinstance(node, Folder) and since == 42
+    assert [node.id, node.parent.id, node.parent.parent] == ["inner", "outer", course]
+    node, since = due[key(document)]
+    assert isinstance(node, Document) and since == 43
+    assert (node.title, node.id, node.chtime, node.size, node.parent.id) == ("slides.pdf", "document", 1234, 99, "inner")
+
+
+def test_retry_not_due_yet(tmpdir, course):
+    retries = RetryQueue(str(tmpdir.join("retries.json")))
+    retries.add(Folder(course, "Folder", "folder"), 42)
+    assert retries.due({course.id: course}) == []
+
+
+def test_retry_of_vanished_course_is_dropped(tmpdir, course):
+    retries = RetryQueue(str(tmpdir.join("retries.json")))
+    retries.add(Folder(course, "Folder", "folder"), 42)
+    retries._entries[key(Folder(course, "Folder", "folder"))]["due"] = 0
+    assert retries.due({}) == []
+    assert len(retries) == 0
+
+
+def test_resolve(tmpdir, course):
+    path = str(tmpdir.join("retries.json"))
+    retries = RetryQueue(path)
+    folder = Folder(course, "Folder", "folder")
+    retries.add(folder, 42)
+    retries.resolve(key(folder))
+    assert len(RetryQueue(path)) == 0
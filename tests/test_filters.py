@@ -0,0 +1,70 @@
+from studdp.filters import Filter
+from studdp.model import Course, Folder, Document
+
+
+def _tree():
+    course = Course("Course", "course", "semester")
+    recordings = Folder(course, "Recordings", "recordings")
+    week = Folder(recordings, "Week1", "week")
+    slides = Folder(course, "Slides", "slides")
+    return course, recordings, week, slides
+
+
+def test_empty_filter_allows_everything():
+    course, recordings, week, slides = _tree()
+    rules = Filter()
+    assert rules.allows_folder(recordings)
+    assert rules.allows_document(Document(week, "lecture.mp4", "d", 0, 10 ** 10))
+
+
+def test_exclude_pattern_prunes_folder_and_subtree():
+    course, recordings, week, slides = _tree()
+    rules = Filter(exclude=["Recordings/*"])
+    assert not rules.allows_folder(recordings)
+    assert not rules.allows_document(Document(week, "lecture.mp4", "d", 0))
+    assert rules.allows_folder(slides)
+    assert rules.allows_document(Document(slides, "lecture.pdf", "d", 0))
+
+
+def test_patterns_are_case_insensitive_and_match_any_depth():
+    course, recordings, week, slides = _tree()
+    rules = Filter(exclude=["*.MP4"])
+    assert not rules.allows_document(Document(week, "lecture.mp4", "d", 0))
+    assert rules.allows_document(Document(week, "lecture.pdf", "d", 0))
+
+
+def test_excluded_extensions():
+    course, recordings, week, slides = _tree()
+    rules = Filter(extensions=[".MP4", ".avi"])
+    assert not rules.allows_document(Document(slides, "Lecture.mp4", "d", 0))
+    assert not rules.allows_document(Document(slides, "lecture.avi", "d", 0))
+    assert rules.allows_document(Document(slides, "lecture.pdf", "d", 0))
+
+
+def test_excluded_folder_ids():
+    course, recordings, week, slides = _tree()
+    rules = Filter(folders=["recordings"])
+    assert not rules.allows_folder(recordings)
+    assert rules.allows_folder(week)
+
+
+def test_max_size_in_megabytes():
+    course, recordings, week, slides = _tree()
+    rules = Filter(max_size=1)
+    assert rules.allows_document(Document(slides, "small.pdf", "d", 0, 1024 * 1024))
+    assert not rules.allows_document(Document(slides, "big.pdf", "d", 0, 1024 * 1024 + 1))
+
+
+def test_include_only_restricts_documents():
+    course, recordings, week, slides = _tree()
+    rules = Filter(include=["*.pdf"])
+    assert rules.allows_folder(recordings)
+    assert rules.allows_document(Document(week, "notes.pdf", "d", 0))
+    assert not rules.allows_document(Document(week, "lecture.mp4", "d", 0))
+
+
+def test_exclude_wins_over_include():
+    course, recordings, week, slides = _tree()
+    rules = Filter(include=["*.pdf"], exclude=["Slides/old*"])
+    assert not rules.allows_document(Document(slides, "old.pdf", "d", 0))
+    assert rules.allows_document(Document(slides, "new.pdf", "d", 0))
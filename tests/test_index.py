@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from studdp import index as indexing
+from studdp.index import Index, Pipeline
+
+
+@pytest.fixture
+def index(tmpdir):
+    index = Index(str(tmpdir.join("index.db")))
+    for name, text in [("backprop.txt", "the back-propagation algorithm"), ("cpp.txt", "templates in C++ are fun"),
+                       ("question.txt", "what is X? nobody knows")]:
+        path = str(tmpdir.join(name))
+        with open(path, "w") as f:
+            f.write(text)
+        index.add(path, os.path.getmtime(path), text)
+    yield index
+    index.close()
+
+
+def _names(results):
+    return [os.path.basename(path) for path, _ in results]
+
+
+def test_fts_query(index):
+    assert _names(index.search("algorithm")) == ["backprop.txt"]
+
+
+@pytest.mark.parametrize("query, name", [("back-propagation", "backprop.txt"), ("C++", "cpp.txt"),
+                                         ("what is X?", "question.txt"), ('say "hi', None)])
+def test_invalid_fts_syntax_is_searched_as_phrase(index, query, name):
+    assert _names(index.search(query)) == ([name] if name else [])
+
+
+def test_missing_files_are_dropped(index, tmpdir):
+    os.remove(str(tmpdir.join("cpp.txt")))
+    assert index.search("templates") == []
+    assert index._db.execute("SELECT COUNT(*) FROM files WHERE path LIKE '%cpp.txt'").fetchone()[0] == 0
+
+
+def _crash(path):
+    os._exit(1)
+
+
+def test_pipeline_survives_dying_workers(index, tmpdir, monkeypatch):
+    monkeypatch.setitem(indexing.PROCESSORS, ".crash", _crash)
+    pipeline = Pipeline(1, index)
+    crash = tmpdir.join("worker.crash")
+    crash.write("")
+    pipeline.submit(str(crash))
+    deadline = time.time() + 10
+    while pipeline.pending and time.time() < deadline:
+        time.sleep(0.01)
+
+    path = tmpdir.join("after.txt")
+    path.write("indexed after the crash")
+    pipeline.submit(str(path))
+    pipeline._executor.shutdown(wait=True)
+    assert pipeline.pending == 0
+    assert _names(index.search("crash")) == ["after.txt"]
+
+
+def test_archive_is_indexed_without_leaving_files(tmpdir):
+    import zipfile
+    path = str(tmpdir.join("slides.zip"))
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("week1/notes.txt", "gradient descent")
+        archive.writestr("../escape.txt", "outside")
+    results = indexing.process(path)
+    assert [(p, text) for p, _, text in results] == [(path, "week1/notes.txt\ngradient descent")]
+    assert os.listdir(str(tmpdir)) == ["slides.zip"]
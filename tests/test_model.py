@@ -0,0 +1,74 @@
+import io
+import os
+import hashlib
+
+import pytest
+
+from studdp import model
+from studdp.model import Course, Document
+
+
+class FakeResponse:
+    def __init__(self, data, status=200):
+        self.raw = io.BytesIO(data)
+        self.status = status
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status != 200:
+            raise IOError("HTTP %d" % self.status)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+
+@pytest.fixture
+def respond(monkeypatch):
+    responses = []
+
+    def respond(data, status=200):
+        response = FakeResponse(data, status)
+        responses.append(response)
+        monkeypatch.setattr(model.client, "_get", lambda route, stream=False: response)
+        return response
+    return respond
+
+
+def test_download_file_hashes_and_verifies(respond, tmpdir):
+    data = os.urandom(3 * model.BUFFER_SIZE + 17)
+    response = respond(data)
+    path = str(tmpdir.join("folder", "file.bin"))
+    download = model.client.download_file("document", path, len(data))
+    assert open(path, "rb").read() == data
+    assert download.path == path and download.size == len(data)
+    assert download.sha256 == hashlib.sha256(data).hexdigest()
+    assert download.throughput > 0
+    assert response.raw.decode_content and response.closed
+
+
+def test_download_file_rejects_size_mismatch(respond, tmpdir):
+    response = respond(b"truncated")
+    path = str(tmpdir.join("file.bin"))
+    with pytest.raises(IOError):
+        model.client.download_file("document", path, 100)
+    assert tmpdir.listdir() == []
+    assert response.closed
+
+
+def test_download_file_raises_on_http_error(respond, tmpdir):
+    response = respond(b"not found", status=404)
+    with pytest.raises(IOError):
+        model.client.download_file("document", str(tmpdir.join("file.bin")))
+    assert tmpdir.listdir() == []
+    assert response.closed
+
+
+def test_download_document_returns_download_or_none(respond, tmpdir):
+    respond(b"content")
+    document = Document(Course("Course", "course", "semester"), "file.txt", "document", 0, 7)
+    download = model.client.download_document(document, path=str(tmpdir))
+    assert download.path == str(tmpdir.join("file.txt"))
+    assert model.client.download_document(document, overwrite=False, path=str(tmpdir)) is None
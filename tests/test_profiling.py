@@ -0,0 +1,36 @@
+import time
+import threading
+
+from studdp import profiling
+
+
+def _busy():
+    end = time.time() + 0.2
+    while time.time() < end:
+        pass
+
+
+def test_sampler_records_root_first_stacks():
+    sampler = profiling._Sampler(threading.get_ident(), interval=0.001)
+    sampler.start()
+    _busy()
+    sampler.stop()
+    assert sampler.stacks
+    stack = sampler.stacks.most_common(1)[0][0].split(";")
+    assert stack[-1].endswith(":_busy")
+    assert any(entry.endswith(":test_sampler_records_root_first_stacks") for entry in stack[:-1])
+
+
+def test_profile_writes_reports(tmpdir, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmpdir))
+
+    class Task:
+        course_times = {"Course": 0.1}
+
+        def __call__(self):
+            _busy()
+
+    prefix = profiling.profile(Task(), top=5, sample=True)
+    for suffix in [".pstats", "-allocations.txt", "-courses.txt", "-samples.txt"]:
+        assert tmpdir.join(prefix[len(str(tmpdir)) + 1:] + suffix).check()
+    assert "Course" in open(prefix + "-courses.txt").read()
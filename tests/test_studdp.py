@@ -0,0 +1,237 @@
+import os
+
+import pytest
+
+from studdp import model
+from studdp import studdp
+from studdp.cache import Store
+from studdp.checkpoint import Checkpoint, RetryQueue
+from studdp.config import Config
+from studdp.model import Course, Folder, Document
+
+c = Config()
+
+
+class FakeStudip:
+    """
+    stands in for the stud.ip api. tree maps folder ids to (documents, folders) where documents are (title, id, chtime)
+    tuples and folders are (title, id) tuples. local maps the ids of documents on disk to their change time.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.listed = []
+        self.downloaded = []
+        self.failing = set()
+        self.local = {}
+
+    def get_courses(self):
+        return [Course("Course", "course", "semester")]
+
+    def get_contents(self, folder):
+        self.listed.append(folder.id)
+        if folder.id in self.failing:
+            raise IOError("listing %s failed" % folder.id)
+        documents, folders = self.tree[folder.id]
+        return [Document(folder, *entry) for entry in documents] + [Folder(folder, *entry) for entry in folders]
+
+    def download_document(self, document, overwrite=True, path=None, since=None):
+        since = c["last_check"] if since is None else since
+        if document.id in self.local and not (overwrite and document.chtime > since):
+            return None
+        if document.id in self.failing:
+            raise IOError("download of %s failed" % document.id)
+        self.downloaded.append(document.id)
+        self.local[document.id] = document.chtime
+        return None
+
+    def set_chtime(self, document_id, chtime):
+        for documents, _ in self.tree.values():
+            for i, (title, entry_id, _) in enumerate(documents):
+                if entry_id == document_id:
+                    documents[i] = (title, entry_id, chtime)
+
+
+@pytest.fixture
+def studip(monkeypatch, tmpdir):
+    fake = FakeStudip({
+        "course": ([("a.pdf", "a", 5)], [("Outer", "outer")]),
+        "outer": ([("b.pdf", "b", 5)], [("Inner", "inner")]),
+        "inner": ([("c.pdf", "c", 5)], []),
+    })
+    monkeypatch.setattr(model.client, "get_courses", fake.get_courses)
+    monkeypatch.setattr(model.client, "get_contents", fake.get_contents)
+    monkeypatch.setattr(model.client, "download_document", fake.download_document)
+    monkeypatch.setattr(model.client, "get_semester_title", lambda node: "Semester")
+    monkeypatch.setitem(c._settings, "selected_courses", ["course"])
+    monkeypatch.setitem(c._settings, "last_check", 0)
+    return fake
+
+
+@pytest.fixture
+def loop(tmpdir):
+    return studdp._MainLoop(False, False, Checkpoint(str(tmpdir.join("checkpoint"))),
+                            RetryQueue(str(tmpdir.join("retries.json"))))
+
+
+def test_cycle_downloads_everything(studip, loop):
+    loop()
+    assert studip.downloaded == ["a", "b", "c"]
+
+
+def test_sync_of_known_folder_only_lists_that_folder(studip, loop):
+    loop()
+    studip.listed, studip.downloaded, studip.local = [], [], {}
+    loop.sync("course/inner")
+    loop._drain()
+    assert studip.listed == ["inner"]
+    assert studip.downloaded == ["c"]
+
+
+def test_sync_of_unknown_folder_searches_course(studip, loop):
+    loop.sync("course/inner")
+    loop._drain()
+    assert studip.downloaded == ["c"]
+
+
+def test_sync_ignores_checkpoint(studip, loop):
+    loop._progress.start(0, 1200)
+    loop._progress.done("course/inner")
+    loop.sync("course/inner")
+    loop._drain()
+    assert studip.downloaded == ["c"]
+
+
+def test_reload_applies_store_and_index_settings(studip, loop, monkeypatch):
+    monkeypatch.setattr(c, "reload", lambda: None)
+    loop._configure()
+    assert loop._store is None and loop._pipeline is None
+
+    monkeypatch.setitem(c._settings, "on_demand", True)
+    monkeypatch.setitem(c._settings, "quota", 5)
+    loop.reload()
+    loop._should_stop()
+    assert loop._store.quota == 5 * 1024 * 1024
+
+    monkeypatch.setitem(c._settings, "on_demand", False)
+    loop.reload()
+    loop._should_stop()
+    assert loop._store is None
+
+
+def test_failures_do_not_stop_the_cycle(studip, loop):
+    studip.failing = {"outer", "a"}
+    loop()
+    assert studip.downloaded == []
+    assert sorted(loop._retries._entries) == ["course/a", "course/outer"]
+    assert c["last_check"] > 0
+
+
+def test_due_retries_run_before_the_crawl(studip, loop):
+    studip.failing = {"inner"}
+    loop()
+    studip.failing = set()
+    studip.listed = []
+    loop._retries._entries["course/inner"]["due"] = 0
+    loop()
+    assert studip.listed[0] == "inner"
+    assert studip.downloaded == ["a", "b", "c"]
+    assert len(loop._retries) == 0
+
+
+def test_pending_retry_is_compared_against_its_own_check(studip, loop, monkeypatch):
+    loop.overwrite = True
+    monkeypatch.setitem(c._settings, "last_check", 100)
+    studip.local = {"a": 50, "b": 50, "c": 50}
+    studip.set_chtime("c", 150)
+    studip.failing = {"c"}
+    loop()
+    assert loop._retries.since("course/c") == 100
+    assert c["last_check"] > 150
+
+    # the entry is not due yet, so the crawl reaches the document first
+    studip.failing = set()
+    loop()
+    assert studip.downloaded == ["c"]
+    assert studip.local["c"] == 150
+    assert len(loop._retries) == 0
+
+
+@pytest.fixture
+def on_demand(studip, monkeypatch, tmpdir):
+    """
+    runs the loop in on demand mode. Downloads write content[document id] and are recorded in studip.downloaded.
+    """
+    store_path = str(tmpdir.join("documents.db"))
+    monkeypatch.setattr(studdp, "Store", lambda: Store(path=store_path))
+    monkeypatch.setitem(c._settings, "on_demand", True)
+    monkeypatch.setitem(c._settings, "base_path", str(tmpdir.join("studip")))
+    monkeypatch.setattr(model.client, "is_current_semester", lambda node: False)
+    content = {}
+
+    def download_file(document_id, path, size=0):
+        if document_id in studip.failing:
+            raise IOError("download of %s failed" % document_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content.get(document_id, ""))
+        studip.downloaded.append(document_id)
+        return model.Download(path, 1, "hash-%s" % content.get(document_id), 1)
+    monkeypatch.setattr(model.client, "download_file", download_file)
+    return content
+
+
+def _local_copy(document_id, chtime, mtime):
+    course = Course("Course", "course", "semester")
+    path = model.client.local_path(Document(course, "%s.pdf" % document_id, document_id, chtime))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("old")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_on_demand_retry_downloads_changed_document(studip, loop, on_demand, tmpdir):
+    path = _local_copy("a", 5, 1)
+    on_demand["a"] = "v5"
+    loop()
+    assert open(path).read() == "v5"
+
+    studip.set_chtime("a", 10)
+    on_demand["a"] = "v10"
+    studip.failing = {"a"}
+    loop()
+    assert open(path).read() == "v5"
+    assert loop._retries.since("course/a") is not None
+
+    studip.failing = set()
+    loop()
+    assert open(path).read() == "v10"
+    assert len(loop._retries) == 0
+    assert Store(path=str(tmpdir.join("documents.db"))).sha256(path) == "hash-v10"
+
+
+def test_on_demand_keeps_current_local_copies(studip, loop, on_demand):
+    studip.tree = {"course": ([("a.pdf", "a", 5), ("b.pdf", "b", 5)], [])}
+    paths = {document_id: _local_copy(document_id, 5, 10) for document_id in "ab"}
+    os.utime(paths["b"], (1, 1))
+    loop()
+    assert studip.downloaded == ["b"]
+    assert open(paths["a"]).read() == "old"
+
+
+def test_on_demand_stop_keeps_remaining_documents_wanted(studip, loop, on_demand, monkeypatch):
+    monkeypatch.setattr(model.client, "is_current_semester", lambda node: True)
+    studip.tree = {"course": ([("a.pdf", "a", 5), ("a2.pdf", "a2", 5)], [])}
+    download_file = model.client.download_file
+
+    def stop_after_download(document_id, path, size=0):
+        loop.stop()
+        return download_file(document_id, path, size)
+    monkeypatch.setattr(model.client, "download_file", stop_after_download)
+    loop()
+    assert studip.downloaded == ["a"]
+
+    loop._stopping.clear()
+    monkeypatch.setattr(model.client, "download_file", download_file)
+    loop()
+    assert studip.downloaded == ["a", "a2"]